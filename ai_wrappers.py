@@ -1,178 +1,722 @@
+import asyncio
+import atexit
+import collections
+import contextlib
+import functools
+import importlib
+import sys
+from typing import TYPE_CHECKING
 import chess
-from google import genai
-import anthropic
-import streamlit as st
+import httpx
+from aiolimiter import AsyncLimiter
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+import async_runner
+import move_cache
+from move_logic import BoardSnapshot, parse_move
 from openai_client import OpenAIClient
 from config import (
-    USE_STREAMLIT_SECRETS,
-    OPENAI_API_KEY,
-    CLAUDE_API_KEY,
+    get_secret,
     DEEPSEEK_API_URL,
-    DEEPSEEK_API_KEY,
-    GEMINI_API_KEY
+    OPENAI_RPM,
+    OPENAI_MAX_CONCURRENCY,
+    CLAUDE_RPM,
+    CLAUDE_MAX_CONCURRENCY,
+    DEEPSEEK_RPM,
+    DEEPSEEK_MAX_CONCURRENCY,
+    GEMINI_RPM,
+    GEMINI_MAX_CONCURRENCY
 )
 
-# Initialize clients
-standard_client = OpenAIClient(api_key=st.secrets["OPENAI_API_KEY"] if USE_STREAMLIT_SECRETS else OPENAI_API_KEY)
-genai_client = genai.Client(api_key=st.secrets["GEMINI_API_KEY"] if USE_STREAMLIT_SECRETS else GEMINI_API_KEY)
-claude_client = anthropic.Anthropic(api_key=st.secrets["CLAUDE_API_KEY"] if USE_STREAMLIT_SECRETS else CLAUDE_API_KEY)
-deepseek_client = OpenAIClient(
-    api_key=st.secrets["DEEPSEEK_API_KEY"] if USE_STREAMLIT_SECRETS else DEEPSEEK_API_KEY,
-    api_base=DEEPSEEK_API_URL
+if TYPE_CHECKING:
+    import anthropic
+    from google import genai
+
+
+@functools.cache
+def _sdk(module: str):
+    """
+    Import a provider SDK on first use. Each one takes a few hundred ms to import
+    (pydantic models, protobuf registration), and a game usually needs one or two of them.
+    :param module: module name (e.g., "anthropic", "google.genai.types").
+    :return: the imported module.
+    """
+    return importlib.import_module(module)
+
+
+# One pooled HTTP/2 client shared by every provider, so consecutive moves reuse
+# open TCP+TLS connections instead of paying a new handshake per call.
+# httpx drops idle connections after 5s by default, shorter than a typical wait for the
+# opponent's move, which would mean a fresh handshake to each provider on almost every ply.
+http_client = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=120.0),
+    timeout=httpx.Timeout(60.0, connect=10.0)
 )
 
 
-def get_openai_move(board: chess.Board, sub_model: str, excluded_moves=None, debug_log=lambda m: None,
-                    include_valid_moves=False) -> str:
+def _close_http_client():
     """
-    Get a move from OpenAI's API based on the current board state and excluded moves.
-    :param board:  chess.Board object representing the current game state.
-    :param sub_model:  The specific OpenAI model to use (e.g., "gpt-4o-mini").
-    :param excluded_moves:  List of moves that are invalid or previously attempted.
-    :param debug_log:  Function to log debug messages.
-    :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
-    :return:  The best move in UCI format as a string.
+    Close the shared HTTP client's connections on interpreter exit.
+    """
+    async_runner.run(http_client.aclose(), timeout=5)
+
+
+atexit.register(_close_http_client)
+
+
+# Per-provider in-flight cap and requests-per-minute token bucket, so concurrent
+# fan-out stays under each account's rate limits instead of triggering 429 retries.
+_SEMAPHORES = {
+    'OpenAI': asyncio.Semaphore(OPENAI_MAX_CONCURRENCY),
+    'Claude': asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY),
+    'DeepSeek': asyncio.Semaphore(DEEPSEEK_MAX_CONCURRENCY),
+    'Gemini': asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+}
+_RATE_LIMITS = {
+    'OpenAI': AsyncLimiter(OPENAI_RPM, 60),
+    'Claude': AsyncLimiter(CLAUDE_RPM, 60),
+    'DeepSeek': AsyncLimiter(DEEPSEEK_RPM, 60),
+    'Gemini': AsyncLimiter(GEMINI_RPM, 60)
+}
+
+
+@contextlib.asynccontextmanager
+async def provider_slot(engine: str):
+    """
+    Wait for a free concurrency slot and a rate-limit token before calling a provider.
+    :param engine: Engine name (e.g., "OpenAI").
+    """
+    async with _SEMAPHORES[engine], _RATE_LIMITS[engine]:
+        yield
+
+
+# Upper bound on reply length for every provider (shared with the batch path).
+# A UCI move is at most 5 ASCII characters, a handful of tokens.
+MOVE_MAX_TOKENS = 8
+# Models that count their chain of thought against max_tokens: any small cap runs out before
+# the answer, so they get no cap and are cut off client-side after the first token instead.
+REASONING_MODELS = frozenset({"deepseek-reasoner", "o1-mini", "o3-mini"})
+
+# Max number of distinct prompts / engine responses kept in memory.
+PROMPT_CACHE_SIZE = 4096
+MOVE_CACHE_SIZE = 4096
+
+# (engine, sub_model, fen, sorted excluded moves, include_valid_moves) -> raw response
+_move_cache = collections.OrderedDict()
+
+# Leads every disk cache key. Bump it whenever SYSTEM_PROMPT, the per-move prompt or the
+# reply format changes, so replies to an older prompt are never served from disk.
+PROMPT_VERSION = 2
+
+
+# Clients are built on first use and cached per API key, so a provider that is never
+# played never reads its secret or constructs its SDK client.
+# SDK-level retries are off (max_retries=0): get_move retries transient errors itself.
+@functools.lru_cache(maxsize=8)
+def _client_openai(api_key: str) -> OpenAIClient:
+    return OpenAIClient(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+@functools.lru_cache(maxsize=8)
+def _client_deepseek(api_key: str) -> OpenAIClient:
+    return OpenAIClient(api_key=api_key, api_base=DEEPSEEK_API_URL, http_client=http_client, max_retries=0)
+
+
+@functools.lru_cache(maxsize=8)
+def _client_claude(api_key: str) -> "anthropic.AsyncAnthropic":
+    return _sdk("anthropic").AsyncAnthropic(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+@functools.lru_cache(maxsize=8)
+def _client_gemini(api_key: str) -> "genai.Client":
+    types = _sdk("google.genai.types")
+    return _sdk("google.genai").Client(api_key=api_key, http_options=types.HttpOptions(httpx_async_client=http_client))
+
+
+# Engine name -> (secret name, client factory)
+_CLIENT_FACTORIES = {
+    'OpenAI': ("OPENAI_API_KEY", _client_openai),
+    'Claude': ("CLAUDE_API_KEY", _client_claude),
+    'DeepSeek': ("DEEPSEEK_API_KEY", _client_deepseek),
+    'Gemini': ("GEMINI_API_KEY", _client_gemini)
+}
+
+# Keys typed into the UI; they take precedence over config.get_secret().
+_user_api_keys = {}
+
+
+def set_user_api_key(engine: str, api_key: str):
+    """
+    Use a user-provided API key for an engine instead of the configured one.
+    :param engine: Engine name (e.g., "OpenAI").
+    :param api_key: The key to use; an empty string restores the configured key.
+    :return: None
+    """
+    _user_api_keys[engine] = api_key
+
+
+def get_client(engine: str):
+    """
+    Return the SDK client for an engine, building it on first use.
+    :param engine: Engine name (e.g., "OpenAI").
+    :return: OpenAIClient, anthropic.AsyncAnthropic or genai.Client.
+    """
+    secret_name, factory = _CLIENT_FACTORIES[engine]
+    return factory(_user_api_keys.get(engine) or get_secret(secret_name))
+
+
+def first_token(text: str) -> str:
+    """
+    The move part of a reply: engines are asked for a bare UCI move, so anything after the
+    first whitespace is dropped. Streamed, batched and sampled replies all go through this.
+    :param text:  Reply text.
+    :return:  The first token of the reply (e.g. "e2e4"), or "" if the reply was empty.
+    """
+    tokens = text.split(maxsplit=1)
+    return tokens[0] if tokens else ""
+
+
+async def _read_first_token(text_stream) -> str:
+    """
+    Consume streamed reply text only until the first whitespace-terminated token,
+    so a UCI move returns as soon as it is emitted instead of after the whole reply.
+    :param text_stream:  Async iterable of text pieces.
+    :return:  The first token of the reply (e.g. "e2e4"), or "" if the reply was empty.
+    """
+    text = ""
+    async for piece in text_stream:
+        text += piece
+        stripped = text.lstrip()
+        if stripped and any(char.isspace() for char in stripped):
+            break
+    return first_token(text)
+
+
+def chat_max_tokens(model: str) -> dict:
+    """
+    The reply length cap for a Chat Completions request.
+    :param model:  The specific model to use.
+    :return:  {"max_tokens": MOVE_MAX_TOKENS}, or {} for REASONING_MODELS.
     """
+    return {} if model in REASONING_MODELS else {"max_tokens": MOVE_MAX_TOKENS}
 
-    prompt = build_chess_prompt(board, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
 
-    debug_log(f"[OpenAI/{sub_model}] Prompt:\n{prompt}")
+async def _chat_completion_call(client: OpenAIClient, model: str, prompt: str, temperature: float = 0.0) -> str:
+    """
+    Adapter for OpenAI-compatible chat completions (OpenAI and DeepSeek).
+    :param client:  OpenAIClient to call.
+    :param model:  The specific model to use.
+    :param prompt:  Prompt built by build_chess_prompt.
+    :param temperature:  Sampling temperature.
+    :return:  The first token of the reply.
+    """
+    stream = await client.chat_completion(
+        model=model,
+        messages=chat_messages(prompt),
+        temperature=temperature,
+        stop=["\n"],
+        stream=True,
+        **chat_max_tokens(model)
+    )
+    try:
+        return await _read_first_token(chunk.choices[0].delta.content or "" async for chunk in stream if chunk.choices)
+    finally:
+        await stream.close()
 
-    resp = standard_client.chat_completion(
-        model=sub_model,
+
+async def _claude_call(client: "anthropic.AsyncAnthropic", model: str, prompt: str, temperature: float = 0.0) -> str:
+    """
+    Adapter for Anthropic's Messages API.
+    :param client:  Anthropic client to call.
+    :param model:  The specific model to use.
+    :param prompt:  Prompt built by build_chess_prompt.
+    :param temperature:  Sampling temperature.
+    :return:  The first token of the reply.
+    """
+    # Anthropic rejects whitespace-only stop sequences, so the early stop happens client-side.
+    async with client.messages.stream(
+        model=model,
+        max_tokens=MOVE_MAX_TOKENS,
+        temperature=temperature,
+        system=CLAUDE_SYSTEM,
         messages=[{"role": "user", "content": prompt}],
-        temperature=0
+    ) as stream:
+        return await _read_first_token(stream.text_stream)
+
+
+async def _gemini_call(client: "genai.Client", model: str, prompt: str, temperature: float = 0.0) -> str:
+    """
+    Adapter for Gemini's generate_content API.
+    :param client:  Gemini client to call.
+    :param model:  The specific model to use.
+    :param prompt:  Prompt built by build_chess_prompt.
+    :param temperature:  Sampling temperature.
+    :return:  The first token of the reply.
+    """
+    stream = await client.aio.models.generate_content_stream(
+        model=model,
+        contents=prompt,
+        config=_sdk("google.genai.types").GenerateContentConfig(
+            max_output_tokens=MOVE_MAX_TOKENS, stop_sequences=["\n"], temperature=temperature,
+            system_instruction=SYSTEM_PROMPT
+        )
     )
-    raw = resp.choices[0].message.content.strip()
-    debug_log(f"[OpenAI/{sub_model}] Raw Response: {raw}")
-    return raw
+    async with contextlib.aclosing(stream):
+        return await _read_first_token(chunk.text or "" async for chunk in stream)
 
 
-def get_claude_move(board: chess.Board, sub_model: str, excluded_moves=None, debug_log=lambda m: None,
-                    include_valid_moves=False) -> str:
+async def _chat_completion_samples(client: OpenAIClient, model: str, prompt: str, temperature: float,
+                                   num_samples: int) -> list:
+    """
+    Sampling adapter for OpenAI: one request returning num_samples completions (n=).
+    Not streamed, the choices would arrive interleaved, and each is only a few tokens anyway.
+    :param client:  OpenAIClient to call.
+    :param model:  The specific model to use.
+    :param prompt:  Prompt built by build_chess_prompt.
+    :param temperature:  Sampling temperature.
+    :param num_samples:  Number of completions to request.
+    :return:  The first token of every choice.
     """
-    Get a move from Claude's API based on the current board state and excluded moves.
-    :param board:  chess.Board object representing the current game state.
-    :param sub_model:  The specific Claude model to use (e.g., "claude-3-5-haiku-20241022").
+    response = await client.chat_completion(
+        model=model,
+        messages=chat_messages(prompt),
+        temperature=temperature,
+        stop=["\n"],
+        n=num_samples,
+        **chat_max_tokens(model)
+    )
+    return [first_token(choice.message.content or "") for choice in response.choices]
+
+
+# Retry budget for a single provider call (rate limits, 5xx, timeouts, dropped connections).
+CALL_MAX_ATTEMPTS = 4
+
+_TRANSIENT_ERRORS = (httpx.TimeoutException, httpx.NetworkError)
+# SDK module -> its transient error classes. Looked up only in SDKs that are already
+# imported: one that was never loaded can't have raised anything.
+_SDK_TRANSIENT_ERRORS = {
+    "openai": ("RateLimitError", "APIConnectionError", "InternalServerError"),
+    "anthropic": ("RateLimitError", "APIConnectionError", "InternalServerError"),
+    "google.genai.errors": ("ServerError",)
+}
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """
+    Whether a provider error is worth retrying (as opposed to e.g. a bad key or model name).
+    :param exc: exception raised by a call adapter.
+    :return: True for rate limits, server errors, timeouts and connection errors.
+    """
+    if isinstance(exc, _TRANSIENT_ERRORS):
+        return True
+    for module_name, error_names in _SDK_TRANSIENT_ERRORS.items():
+        module = sys.modules.get(module_name)
+        if module is not None and isinstance(exc, tuple(getattr(module, name) for name in error_names)):
+            return True
+    genai_errors = sys.modules.get("google.genai.errors")
+    return genai_errors is not None and isinstance(exc, genai_errors.ClientError) and exc.code == 429
+
+
+# Engine name -> call adapter
+PROVIDERS = {
+    'OpenAI': _chat_completion_call,
+    'Claude': _claude_call,
+    'DeepSeek': _chat_completion_call,
+    'Gemini': _gemini_call
+}
+
+
+# Engine name -> adapter returning several samples from a single request. Providers without
+# one (DeepSeek, Claude, Gemini have no n=) get concurrent PROVIDERS calls instead.
+SAMPLERS = {
+    'OpenAI': _chat_completion_samples
+}
+
+
+class _InFlight:
+    """
+    A provider request shared by every caller asking the same question at the same time
+    (e.g. a speculative prefetch and the real move request). The request is cancelled
+    only once all of its waiters have given up on it.
+    """
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+    async def wait(self) -> str:
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.task)
+        finally:
+            self.waiters -= 1
+            if self.waiters == 0:
+                self.task.cancel()
+
+
+# Same key as _move_cache -> request currently in flight
+_inflight = {}
+
+
+async def get_move(provider: str, snapshot: BoardSnapshot, sub_model: str, excluded_moves=None,
+                   debug_log=lambda m: None, include_valid_moves=False, temperature=0.0) -> str:
+    """
+    Get a move from the given provider's API based on the current board state and excluded moves.
+    Forced moves and repeated positions (with a legal reply) are answered locally without
+    calling the API, and identical concurrent requests share a single API call.
+    :param provider:  Engine name, one of PROVIDERS (e.g., "OpenAI").
+    :param snapshot:  BoardSnapshot of the current game state.
+    :param sub_model:  The specific model to use (e.g., "gpt-4o-mini").
     :param excluded_moves:  List of moves that are invalid or previously attempted.
     :param debug_log:  Function to log debug messages.
     :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
+    :param temperature:  Sampling temperature; parallel attempts at one position use different ones.
     :return:  The best move in UCI format as a string.
     """
+    if len(snapshot.legal_uci) < 2:
+        forced = snapshot.legal_uci[0] if snapshot.legal_uci else ""
+        debug_log(f"[{provider}/{sub_model}] Forced move, skipping the API: {forced or 'none (game over)'}")
+        return forced
 
-    prompt = build_chess_prompt(board, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
+    key = (provider, sub_model, snapshot.fen, tuple(sorted(excluded_moves or ())), include_valid_moves, temperature)
+    if key in _move_cache:
+        _move_cache.move_to_end(key)
+        debug_log(f"[{provider}/{sub_model}] Cached Response: {_move_cache[key]}")
+        return _move_cache[key]
 
-    debug_log(f"[Claude/{sub_model}] Prompt:\n{prompt}")
+    request = _inflight.get(key)
+    if request is None:
+        request = _inflight[key] = _InFlight(asyncio.ensure_future(
+            _fetch_move(key, provider, snapshot, sub_model, excluded_moves, debug_log, include_valid_moves, temperature)
+        ))
+        request.task.add_done_callback(lambda _: _inflight.pop(key) if _inflight.get(key) is request else None)
+    else:
+        debug_log(f"[{provider}/{sub_model}] Joining in-flight request")
+    return await request.wait()
 
-    response = claude_client.messages.create(
-        model=sub_model,
-        max_tokens=360,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    content = response.content
-    if isinstance(content, list):
-        content = "".join(getattr(block, 'text', str(block)) for block in content)
-    raw = content.strip()
-    debug_log(f"[Claude/{sub_model}] Raw: {raw}")
+
+async def _fetch_move(key, provider, snapshot, sub_model, excluded_moves, debug_log, include_valid_moves,
+                      temperature) -> str:
+    """
+    Answer get_move from the disk cache, or call the provider (with retries), and store the
+    reply in the response cache. Running as the in-flight request, the disk is only read once
+    for concurrent identical requests.
+    :return:  The raw reply.
+    """
+    disk_key = (PROMPT_VERSION,) + key
+    # Only deterministic (temperature 0) replies are worth keeping across restarts
+    if temperature == 0:
+        raw = await move_cache.get(disk_key)
+        if raw is not None:
+            _store_move(key, raw)
+            debug_log(f"[{provider}/{sub_model}] Cached Response (disk): {raw}")
+            return raw
+
+    prompt = build_chess_prompt(snapshot, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
+
+    debug_log(f"[{provider}/{sub_model}] Prompt:\n{prompt}")
+
+    async for attempt in _retrying(provider, sub_model, debug_log):
+        with attempt:
+            async with provider_slot(provider):
+                raw = await PROVIDERS[provider](get_client(provider), sub_model, prompt, temperature)
+    debug_log(f"[{provider}/{sub_model}] Raw Response: {raw}")
+
+    # An illegal reply is not cached: the next attempt may ask the very same question
+    # (safe_get_move excludes a repeated reply only once), and the model must be asked again.
+    if _is_legal_reply(snapshot, raw):
+        _store_move(key, raw)
+        if temperature == 0:
+            move_cache.put(disk_key, raw)
     return raw
 
 
-def get_deepseek_move(board: chess.Board, sub_model: str, excluded_moves=None, debug_log=lambda m: None,
-                      include_valid_moves=False) -> str:
+def _is_legal_reply(snapshot: BoardSnapshot, raw: str) -> bool:
     """
-    Get a move from DeepSeek's API based on the current board state and excluded moves.
-    :param board:  chess.Board object representing the current game state.
-    :param sub_model:  The specific DeepSeek model to use (e.g., "deepseek-chat").
-    :param excluded_moves:  List of moves that are invalid or previously attempted.
-    :param debug_log:  Function to log debug messages.
-    :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
-    :return:  The best move in UCI format as a string.
+    :param snapshot:  BoardSnapshot the reply was given for.
+    :param raw:  Raw engine reply.
+    :return:  True if the reply is a legal move there (UCI, or SAN as parse_move accepts it).
     """
+    return raw in snapshot.legal_uci or (bool(raw) and parse_move(snapshot.to_board(), raw) is not None)
+
 
-    prompt = build_chess_prompt(board, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
+def _store_move(key, raw: str):
+    """
+    Put a reply in the in-memory response cache, evicting the least recently used one.
+    """
+    _move_cache[key] = raw
+    if len(_move_cache) > MOVE_CACHE_SIZE:
+        _move_cache.popitem(last=False)
 
-    debug_log(f"[DeepSeek/{sub_model}] Prompt:\n{prompt}")
 
-    resp = deepseek_client.chat_completion(
-        model=sub_model,
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
+def _retrying(provider: str, sub_model: str, debug_log) -> AsyncRetrying:
+    """
+    Retry transient failures with jittered backoff, instead of letting an empty or failed
+    reply cost a whole extra turn in safe_get_move. Each attempt takes a new rate-limit token.
+    :return:  AsyncRetrying to iterate over.
+    """
+    return AsyncRetrying(
+        retry=retry_if_exception(_is_transient),
+        wait=wait_random_exponential(multiplier=0.5, max=8),
+        stop=stop_after_attempt(CALL_MAX_ATTEMPTS),
+        before_sleep=lambda state: debug_log(
+            f"[{provider}/{sub_model}] Retry #{state.attempt_number} after: {state.outcome.exception()!r}"
+        ),
+        reraise=True
     )
-    raw = resp.choices[0].message.content.strip()
-    debug_log(f"[DeepSeek/{sub_model}] Raw Response: {raw}")
-    return raw
 
 
-def get_gemini_move(board: chess.Board, sub_model: str, excluded_moves=None, debug_log=lambda m: None,
-                    include_valid_moves=False) -> str:
+# Default temperature for get_move_samples; at 0 every sample would be the same move.
+SAMPLE_TEMPERATURE = 0.7
+
+
+async def get_move_samples(provider: str, snapshot: BoardSnapshot, sub_model: str, num_samples=3,
+                           excluded_moves=None, debug_log=lambda m: None, include_valid_moves=False,
+                           temperature=SAMPLE_TEMPERATURE) -> list:
     """
-    Get a move from Gemini's API based on the current board state and excluded moves.
-    :param board:  chess.Board object representing the current game state.
-    :param sub_model:  The specific Gemini model to use (e.g., "gemini-2.0-flash").
+    Get several candidate moves for one position in a single round-trip: one n= request where
+    the provider supports it (see SAMPLERS), otherwise num_samples concurrent requests sharing
+    the pooled HTTP/2 connection. Samples are random by design, so they are not cached.
+    :param provider:  Engine name, one of PROVIDERS (e.g., "OpenAI").
+    :param snapshot:  BoardSnapshot of the current game state.
+    :param sub_model:  The specific model to use (e.g., "gpt-4o-mini").
+    :param num_samples:  Number of candidate moves to ask for.
     :param excluded_moves:  List of moves that are invalid or previously attempted.
     :param debug_log:  Function to log debug messages.
     :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
-    :return:  The best move in UCI format as a string.
+    :param temperature:  Sampling temperature.
+    :return:  List of raw replies, best guess first.
     """
+    if len(snapshot.legal_uci) < 2:
+        return [await get_move(provider, snapshot, sub_model, debug_log=debug_log)]
 
-    prompt = build_chess_prompt(board, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
+    prompt = build_chess_prompt(snapshot, excluded_moves=excluded_moves, include_valid_moves=include_valid_moves)
+    debug_log(f"[{provider}/{sub_model}] Prompt ({num_samples} samples):\n{prompt}")
 
-    debug_log(f"[Gemini/{sub_model}] Prompt:\n{prompt}")
+    if provider in SAMPLERS:
+        async for attempt in _retrying(provider, sub_model, debug_log):
+            with attempt:
+                async with provider_slot(provider):
+                    raw = await SAMPLERS[provider](get_client(provider), sub_model, prompt, temperature, num_samples)
+    else:
+        async def sample():
+            async for attempt in _retrying(provider, sub_model, debug_log):
+                with attempt:
+                    async with provider_slot(provider):
+                        return await PROVIDERS[provider](get_client(provider), sub_model, prompt, temperature)
 
-    response = genai_client.models.generate_content(model=sub_model, contents=prompt)
-    raw = response.text.strip()
-    debug_log(f"[Gemini/{sub_model}] Raw: {raw}")
+        results = await asyncio.gather(*[sample() for _ in range(num_samples)], return_exceptions=True)
+        raw = [result for result in results if not isinstance(result, BaseException)]
+        if not raw:
+            raise results[0]
+    debug_log(f"[{provider}/{sub_model}] Raw Samples: {raw}")
     return raw
 
 
+# Static instructions, sent as the system prompt so every request for a game starts with
+# the same bytes: providers cache a repeated prefix (OpenAI automatically, Anthropic through
+# cache_control), and only the short per-move message after it changes.
+SYSTEM_PROMPT = (
+    "You are a chess engine. Each message gives the side to move and the position as a FEN, "
+    "sometimes followed by the legal moves and by moves you must not play.\n"
+    "Return a legal best move for the side to move in UCI format only (e.g. e2e4, or e7e8q for a promotion).\n"
+    "Do not return any explanations or additional text."
+)
+# Anthropic only caches prefixes above a minimum length (1024+ tokens); below it the marker is a no-op,
+# so it only starts paying off if the instructions grow.
+CLAUDE_SYSTEM = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+# Per-move message, built once. Only the FEN and the optional sections are filled in per call.
+_PROMPT_TEMPLATE = (
+    "It is {color}'s turn.\n"
+    "FEN: {fen}\n"
+    "{valid}"
+    "{excluded}"
+)
+# FEN side-to-move field -> template with the color already filled in
+_PROMPTS = {
+    "w": _PROMPT_TEMPLATE.replace("{color}", "White"),
+    "b": _PROMPT_TEMPLATE.replace("{color}", "Black")
+}
+_VALID_MOVES_TEMPLATE = (
+    "Legal moves (UCI): {legal_moves}\n"
+    "Please choose one of these moves.\n"
+)
+_EXCLUDED_MOVES_TEMPLATE = (
+    "Invalid or previously attempted moves that are NOT allowed:\n{excluded_moves}\n"
+    "Do not return any of those moves, and do not return any illegal moves.\n"
+)
+
+
+def chat_messages(prompt: str) -> list:
+    """
+    Chat Completions messages for a move prompt: the shared system prompt, then the move.
+    :param prompt: Prompt built by build_chess_prompt.
+    :return: messages list.
+    """
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}]
+
+
 def build_chess_prompt(
-        board: chess.Board,
+        snapshot: BoardSnapshot,
         excluded_moves: object = None,
         include_valid_moves: bool = False
 ) -> str:
     """
-    Constructs a prompt for move generation based on the current board state,
+    Constructs the per-move prompt (sent after SYSTEM_PROMPT) based on the current board state,
     excluded moves, and optionally includes the list of legal moves.
 
-    :param board: The current chess.Board object.
+    :param snapshot: BoardSnapshot of the current position.
     :param excluded_moves: List of moves to exclude from the suggestion.
     :param include_valid_moves: Whether to append a list of legal moves to the prompt.
     :return: The constructed prompt string.
     """
-    if excluded_moves is None:
-        excluded_moves = []
-    color_str = "White" if board.turn == chess.WHITE else "Black"
+    # The snapshot already holds the legal moves, generated once for the whole turn
+    legal_moves = " ".join(snapshot.legal_uci) if include_valid_moves else ""
+    return _build_prompt_for_fen(snapshot.fen, tuple(excluded_moves or ()), legal_moves)
+
 
+@functools.lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _build_prompt_for_fen(fen: str, excluded_moves: tuple, legal_moves: str) -> str:
+    """
+    Memoized body of build_chess_prompt, keyed on hashable arguments only.
+    :param fen: FEN of the position to prompt for.
+    :param excluded_moves: Tuple of moves to exclude from the suggestion.
+    :param legal_moves: Space-separated legal moves (UCI) to append, or "" to leave them out.
+    :return: The constructed prompt string.
+    """
     exclusion_text = ""
     valid_moves_str = ""
-    if excluded_moves:
-        exclusion_text = (
-            f"Invalid or previously attempted moves that are NOT allowed:\n{excluded_moves}\n"
-            "Do not return any of those moves, and do not return any illegal moves.\n"
-        )
+    # Space-separated like the legal list; a Python list repr spends tokens on quotes and commas.
+    # Empty replies have nothing to exclude.
+    excluded = " ".join(move for move in excluded_moves if move)
+    if excluded:
+        exclusion_text = _EXCLUDED_MOVES_TEMPLATE.format_map({"excluded_moves": excluded})
 
-    if include_valid_moves:
+    if legal_moves:
         # Append legal moves to the prompt
-        legal_moves = ", ".join(move.uci() for move in board.legal_moves)
-        valid_moves_str = (
-            f"Here is a list of legal moves: {legal_moves}\n"
-            "Please choose one of these moves.\n"
-        )
+        valid_moves_str = _VALID_MOVES_TEMPLATE.format_map({"legal_moves": legal_moves})
 
-    current_move_prompt = (
-        f"You are a chess engine. It is {color_str}'s turn.\n"
-        f"Given this FEN: {board.fen()}, return a legal best move in UCI format only.\n"
-        f"{valid_moves_str}"
-        "Do not return any explanations or additional text.\n"
-        f"{exclusion_text}"
-    )
+    return _PROMPTS[fen.split(" ", 2)[1]].format_map({"fen": fen, "valid": valid_moves_str, "excluded": exclusion_text})
 
-    return current_move_prompt
 
+async def get_moves_parallel(jobs, debug_log=lambda m: None, include_valid_moves=False) -> list:
+    """
+    Query several engines concurrently so their network round-trips overlap.
+    :param jobs: Iterable of (engine, sub_model, snapshot) tuples.
+    :param debug_log:  Function to log debug messages.
+    :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
+    :return:  List of raw engine responses, in the same order as jobs.
+    """
+    return await asyncio.gather(*[
+        ENGINE_FUNCTIONS_ASYNC[engine](snapshot, sub_model, debug_log=debug_log,
+                                       include_valid_moves=include_valid_moves)
+        for engine, sub_model, snapshot in jobs
+    ])
 
-ENGINE_FUNCTIONS = {
-    'OpenAI': get_openai_move,
-    'Claude': get_claude_move,
-    'DeepSeek': get_deepseek_move,
-    'Gemini': get_gemini_move
-}
+
+async def race_move(snapshot: BoardSnapshot, candidates, excluded_moves=None, debug_log=lambda m: None,
+                    include_valid_moves=False, temperature=0.0) -> str:
+    """
+    Ask several (engine, sub_model) candidates at once and return the first legal reply,
+    cancelling the requests still in flight. The winner's latency replaces the slowest one's.
+    :param snapshot:  BoardSnapshot of the current game state.
+    :param candidates:  List of (engine, sub_model) tuples to race.
+    :param excluded_moves:  List of moves that are invalid or previously attempted.
+    :param debug_log:  Function to log debug messages.
+    :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
+    :param temperature:  Sampling temperature for every candidate.
+    :return:  The first legal move, or the last reply received if none was legal.
+    """
+    board = snapshot.to_board()
+    tasks = {
+        asyncio.create_task(get_move(engine, snapshot, sub_model, excluded_moves=excluded_moves,
+                                     debug_log=debug_log, include_valid_moves=include_valid_moves,
+                                     temperature=temperature)): (engine, sub_model)
+        for engine, sub_model in candidates
+    }
+    pending = set(tasks)
+    last_raw = None
+    errors = []
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                engine, sub_model = tasks[task]
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    debug_log(f"[{engine}/{sub_model}] Race error: {task.exception()}")
+                    continue
+                last_raw = task.result()
+                if parse_move(board, last_raw) is not None:
+                    debug_log(f"[{engine}/{sub_model}] Won the race with: {last_raw}")
+                    return last_raw
+    finally:
+        async_runner.cancel_all(tasks)
+
+    if last_raw is None and errors:
+        raise errors[0]
+    return last_raw or ""
+
+
+def prefetch_moves(engine: str, sub_model: str, board: chess.Board, replies, debug_log=lambda m: None,
+                   include_valid_moves=False) -> dict:
+    """
+    Speculatively start an engine's next move for each likely opponent reply, so the
+    request is already in flight (or answered) by the time the opponent has moved.
+    A matching real request joins the prefetched one through get_move's in-flight sharing.
+    :param engine:  Engine of the side that just moved (e.g., "OpenAI").
+    :param sub_model:  Sub-model of that side.
+    :param board:  Position after that side's move (opponent to move); it is left unchanged.
+    :param replies:  Opponent moves to prefetch for.
+    :param debug_log:  Function to log debug messages.
+    :param include_valid_moves:  Whether to include a list of valid moves in the prompt.
+    :return:  dict of reply -> concurrent.futures.Future; cancel the ones that weren't played.
+    """
+    futures = {}
+    for reply in replies:
+        board.push(reply)
+        snapshot = BoardSnapshot.from_board(board)
+        board.pop()
+        futures[reply] = async_runner.submit(get_move(engine, snapshot, sub_model, debug_log=debug_log,
+                                                      include_valid_moves=include_valid_moves))
+    return futures
+
+
+def race_engine_function(candidates):
+    """
+    Build an engine function (same signature as ENGINE_FUNCTIONS_ASYNC values) that races candidates.
+    Used for the opt-in fast mode; the sub_model argument is ignored in favour of candidates.
+    :param candidates:  List of (engine, sub_model) tuples to race.
+    :return:  Async engine function.
+    """
+    candidates = list(dict.fromkeys(candidates))
+
+    async def engine_func(snapshot, sub_model, excluded_moves=None, debug_log=lambda m: None,
+                          include_valid_moves=False, temperature=0.0):
+        return await race_move(snapshot, candidates, excluded_moves=excluded_moves, debug_log=debug_log,
+                               include_valid_moves=include_valid_moves, temperature=temperature)
+
+    return engine_func
+
+
+def _run_sync(async_func):
+    """
+    Wrap an async engine function so it can be called from the synchronous Streamlit script.
+    The coroutine runs on the shared background loop (see async_runner).
+    :param async_func: async engine function to wrap.
+    :return: blocking function with the same signature.
+    """
+    @functools.wraps(async_func)
+    def wrapper(*args, **kwargs):
+        return async_runner.run(async_func(*args, **kwargs))
+
+    return wrapper
+
+
+ENGINE_FUNCTIONS_ASYNC = {name: functools.partial(get_move, name) for name in PROVIDERS}
+
+ENGINE_FUNCTIONS = {name: _run_sync(func) for name, func in ENGINE_FUNCTIONS_ASYNC.items()}
+
+ENGINE_SAMPLERS_ASYNC = {name: functools.partial(get_move_samples, name) for name in PROVIDERS}
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return the background event loop used for all engine calls, starting it on first use.
+    Streamlit reruns the script in a fresh thread each time, so the async SDK clients
+    (and their connection pools) live on one long-lived loop instead of a new
+    asyncio.run() loop per call.
+    :return: the running background event loop.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="engine-loop", daemon=True).start()
+    return _loop
+
+
+def submit(coro):
+    """
+    Schedule a coroutine on the background loop without waiting for it.
+    :param coro: coroutine to schedule.
+    :return: concurrent.futures.Future resolving to the coroutine's result.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def run(coro, timeout=None):
+    """
+    Run a coroutine on the background loop and block until it finishes.
+    :param coro: coroutine to run.
+    :param timeout: optional number of seconds to wait before raising TimeoutError.
+    :return: the coroutine's result.
+    """
+    return submit(coro).result(timeout)
+
+
+async def run_async(coro):
+    """
+    Await a coroutine that runs on the background loop from another event loop
+    (the game loop on the script thread). Cancelling the awaiting task, e.g. through
+    asyncio.wait_for, cancels the coroutine on the background loop as well.
+    :param coro: coroutine to run.
+    :return: the coroutine's result.
+    """
+    return await asyncio.wrap_future(submit(coro))
+
+
+def cancel_all(tasks):
+    """
+    Cancel the tasks still running and retrieve the exceptions of the ones that failed,
+    for callers that stop at the first useful result. Otherwise asyncio logs "Task exception
+    was never retrieved" with a traceback, into the game log through the root logger.
+    :param tasks: iterable of asyncio tasks.
+    """
+    for task in tasks:
+        task.cancel()
+        task.add_done_callback(_retrieve_exception)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    """
+    Done callback marking a finished task's exception as retrieved.
+    """
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,174 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import chess
+import orjson
+
+import ai_wrappers
+from ai_wrappers import build_chess_prompt, chat_messages, first_token
+from move_logic import BoardSnapshot
+
+# Only these providers expose a batch API.
+BATCH_ENGINES = ("OpenAI", "Claude")
+
+_OPENAI_DONE = ("completed", "failed", "expired", "cancelled")
+
+
+@dataclass
+class MoveJob:
+    """
+    A single move request for the batch APIs.
+    custom_id must be unique within a batch (letters, digits, '_' and '-', up to 64 chars).
+    """
+    custom_id: str
+    engine: str
+    sub_model: str
+    board: chess.Board
+    excluded_moves: List[str] = field(default_factory=list)
+    include_valid_moves: bool = False
+
+    def __post_init__(self):
+        # Own a history-free copy: jobs are usually built while a game (or eval loop) keeps
+        # pushing moves on the same board, and a job only needs its position.
+        self.board = self.board.copy(stack=False)
+
+    def prompt(self) -> str:
+        """
+        :return: the same prompt the interactive engine wrappers would send.
+        """
+        return build_chess_prompt(BoardSnapshot.from_board(self.board), excluded_moves=self.excluded_moves,
+                                  include_valid_moves=self.include_valid_moves)
+
+
+@dataclass
+class BatchHandle:
+    """
+    Ids of the provider batches created by submit(). A provider without jobs keeps None.
+    """
+    openai_batch_id: Optional[str] = None
+    claude_batch_id: Optional[str] = None
+
+
+async def submit(jobs: List[MoveJob]) -> BatchHandle:
+    """
+    Group move requests per provider and submit them through the OpenAI Batch API
+    and Anthropic Message Batches (about half the cost, results within 24h).
+    Meant for offline runs (evals, regression suites) where latency doesn't matter.
+    :param jobs: list of MoveJob objects, engine must be one of BATCH_ENGINES.
+    :return: BatchHandle to pass to wait_for_results().
+    """
+    unsupported = {job.engine for job in jobs} - set(BATCH_ENGINES)
+    if unsupported:
+        raise ValueError(f"No batch API for engine(s): {', '.join(sorted(unsupported))}")
+
+    handle = BatchHandle()
+    openai_jobs = [job for job in jobs if job.engine == "OpenAI"]
+    claude_jobs = [job for job in jobs if job.engine == "Claude"]
+
+    if openai_jobs:
+        lines = [
+            orjson.dumps({
+                "custom_id": job.custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": job.sub_model,
+                    "messages": chat_messages(job.prompt()),
+                    "temperature": 0,
+                    **ai_wrappers.chat_max_tokens(job.sub_model)
+                }
+            })
+            for job in openai_jobs
+        ]
+        client = ai_wrappers.get_client("OpenAI").client
+        input_file = await client.files.create(
+            file=("moves.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        openai_batch = await client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        handle.openai_batch_id = openai_batch.id
+
+    if claude_jobs:
+        claude_batch = await ai_wrappers.get_client("Claude").messages.batches.create(requests=[
+            {
+                "custom_id": job.custom_id,
+                "params": {
+                    "model": job.sub_model,
+                    "max_tokens": ai_wrappers.MOVE_MAX_TOKENS,
+                    "temperature": 0,
+                    "system": ai_wrappers.CLAUDE_SYSTEM,
+                    "messages": [{"role": "user", "content": job.prompt()}]
+                }
+            }
+            for job in claude_jobs
+        ])
+        handle.claude_batch_id = claude_batch.id
+
+    return handle
+
+
+async def wait_for_results(handle: BatchHandle, poll_interval: float = 30.0) -> Dict[str, str]:
+    """
+    Poll the submitted batches until they finish and collect the raw move of each job.
+    Jobs that errored map to "", which callers treat like any other invalid move;
+    jobs of a batch that failed or expired as a whole are missing from the dict.
+    :param handle: BatchHandle returned by submit().
+    :param poll_interval: seconds between status checks.
+    :return: dict of custom_id -> raw move string.
+    """
+    results = {}
+
+    if handle.openai_batch_id:
+        client = ai_wrappers.get_client("OpenAI").client
+        openai_batch = await client.batches.retrieve(handle.openai_batch_id)
+        while openai_batch.status not in _OPENAI_DONE:
+            await asyncio.sleep(poll_interval)
+            openai_batch = await client.batches.retrieve(handle.openai_batch_id)
+
+        if openai_batch.output_file_id:
+            output = await client.files.content(openai_batch.output_file_id)
+            for line in output.content.splitlines():
+                if not line.strip():
+                    continue
+                entry = orjson.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    message = response["body"]["choices"][0]["message"]
+                    results[entry["custom_id"]] = first_token(message["content"] or "")
+                else:
+                    results[entry["custom_id"]] = ""
+
+    if handle.claude_batch_id:
+        batches = ai_wrappers.get_client("Claude").messages.batches
+        claude_batch = await batches.retrieve(handle.claude_batch_id)
+        while claude_batch.processing_status != "ended":
+            await asyncio.sleep(poll_interval)
+            claude_batch = await batches.retrieve(handle.claude_batch_id)
+
+        async for entry in await batches.results(handle.claude_batch_id):
+            if entry.result.type == "succeeded":
+                content = entry.result.message.content
+                results[entry.custom_id] = first_token("".join(getattr(block, 'text', str(block)) for block in content))
+            else:
+                results[entry.custom_id] = ""
+
+    return results
+
+
+async def batch_get_moves(jobs: List[MoveJob], poll_interval: float = 30.0) -> Dict[str, str]:
+    """
+    Submit jobs through the provider batch APIs and wait for every result.
+    Like the other engine coroutines it must run on the shared loop, e.g.
+    async_runner.run(batch_get_moves(jobs)).
+    :param jobs: list of MoveJob objects.
+    :param poll_interval: seconds between status checks.
+    :return: dict of custom_id -> raw move string ("" for any job without a result).
+    """
+    handle = await submit(jobs)
+    results = await wait_for_results(handle, poll_interval=poll_interval)
+    return {job.custom_id: results.get(job.custom_id, "") for job in jobs}
@@ -1,3 +1,8 @@
+import os
+from functools import cache
+
+import streamlit as st
+
 # Flag to determine if we should use Streamlit secrets (True) or local config (False)
 USE_STREAMLIT_SECRETS = True  # Set to False if you want to use local config
 
@@ -6,3 +11,34 @@ CLAUDE_API_KEY = "YOUR_CLAUDE_KEY"
 DEEPSEEK_API_URL = "https://api.deepseek.com"
 DEEPSEEK_API_KEY = "YOUR_DEEPSEEK_KEY"
 GEMINI_API_KEY = "YOUR_GEMINI_KEY"
+
+
+@cache
+def get_secret(name: str) -> str:
+    """
+    Resolve an API key on first use and remember it for the process.
+    With USE_STREAMLIT_SECRETS it comes from st.secrets; otherwise from the environment
+    variable of the same name, falling back to the constant above.
+    :param name: Secret name (e.g., "OPENAI_API_KEY").
+    :return: the API key, or "" if it isn't configured anywhere.
+    """
+    if USE_STREAMLIT_SECRETS:
+        return st.secrets[name]
+    return os.environ.get(name) or globals().get(name, "")
+
+
+# Per-provider request budget (requests per minute) and max number of in-flight calls.
+# Tune these to your account's rate-limit tier to avoid 429 retries.
+OPENAI_RPM = 500
+OPENAI_MAX_CONCURRENCY = 32
+CLAUDE_RPM = 50
+CLAUDE_MAX_CONCURRENCY = 8
+DEEPSEEK_RPM = 300
+DEEPSEEK_MAX_CONCURRENCY = 16
+GEMINI_RPM = 60
+GEMINI_MAX_CONCURRENCY = 16
+
+# Engine replies are also kept on disk, so repeated openings skip the API across restarts.
+# Set MOVE_CACHE_PATH to None to keep the cache in memory only.
+MOVE_CACHE_PATH = ".cache/moves.sqlite3"
+MOVE_CACHE_TTL_DAYS = 7
@@ -0,0 +1,33 @@
+# More models can be added here
+ENGINE_MODELS = {
+    "OpenAI": [
+        "gpt-4o-mini",
+        "gpt-3.5-turbo",
+        "gpt-4o",
+        # "o3-mini", # Currently not available for my tier at the openai API
+        # "o1-mini" # Currently not available for my tier at the openai API
+    ],
+    "Claude": [
+        "claude-3-5-haiku-latest",
+        "claude-3-haiku-latest",
+        "claude-3-7-sonnet-latest",
+        "claude-3-5-sonnet-latest",
+        "claude-3-opus-latest",
+        "claude-2.1"
+    ],
+    "DeepSeek": [
+        "deepseek-chat",
+        "deepseek-reasoner"
+    ],
+    "Gemini": [
+        "gemini-2.0-flash",
+        "gemini-pro",
+        "gemini-2.0-flash-lite"
+    ]
+}
+
+
+# Built once per process rather than on every Streamlit rerun
+ENGINE_KEYS = tuple(ENGINE_MODELS)
+# Every engine/sub-model pair, for the fast-mode race pickers
+ENGINE_CHOICES = [(engine, model) for engine, models in ENGINE_MODELS.items() for model in models]
@@ -1,13 +1,38 @@
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Name of the QueueHandler setup_logging installs on the root logger. The root logger
+# outlives module reloads (Streamlit's file watcher), unlike a module global would.
+_HANDLER_NAME = 'game_log_queue'
 
 
 def setup_logging(filename='game_log.pgn'):
     """
     Configure global logging.
+    Records are only enqueued by the caller; a background QueueListener owns the file
+    and does the actual writes, so logging never blocks the game loop or engine calls.
+    Safe to call on every Streamlit rerun (and after module reloads): only the first call
+    installs the handlers.
     :param filename: Name of the log file.
     """
-    logging.basicConfig(
-        filename=filename,
-        level=logging.INFO,
-        format='%(message)s'
-    )
+    root = logging.getLogger()
+    if any(handler.name == _HANDLER_NAME for handler in root.handlers):
+        return
+
+    log_queue = queue.SimpleQueue()
+    # delay=True: the file is only opened once something is actually logged.
+    file_handler = logging.FileHandler(filename, encoding='utf-8', delay=True)
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.set_name(_HANDLER_NAME)
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    # The game log holds PGN only; keep httpx's per-request INFO lines out of it.
+    logging.getLogger('httpx').setLevel(logging.WARNING)
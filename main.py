@@ -1,19 +1,19 @@
 import streamlit as st
 import chess
 import chess.pgn
-import chess.svg
 import time
+import queue
+import asyncio
+import functools
 import logging
-import openai
-import anthropic
-from google import genai
 from datetime import datetime
 
 import ai_wrappers
 from logger import setup_logging
-from ui import render_sidebar, render_main_ui, render_api_key_inputs
-from ai_wrappers import ENGINE_FUNCTIONS
-from move_logic import safe_get_move
+from ui import render_sidebar, render_main_ui, render_api_key_inputs, board_position, position_svg, SPEED_FACTORS
+from ai_wrappers import ENGINE_FUNCTIONS_ASYNC, ENGINE_SAMPLERS_ASYNC, race_engine_function, prefetch_moves
+from move_logic import safe_get_move_async, likely_replies
+from pgn_export import export_pgn
 
 st.set_page_config(
     page_title="AI Chess Battle Royale - Guy Perry",
@@ -39,30 +39,40 @@ def override_api_keys_if_provided(user_keys):
     :param user_keys: Dictionary of user-provided keys
     :return: None
     """
-    # If user typed an OpenAI key, override openai.api_key.
+    # ai_wrappers builds (and caches) a client for whichever key is in effect.
     if user_keys["openai"]:
-        ai_wrappers.standard_client.set_api_key(user_keys["openai"])
+        ai_wrappers.set_user_api_key("OpenAI", user_keys["openai"])
 
-    # For Claude (Anthropic) API, we can set the client directly.
     if user_keys["claude"]:
-        ai_wrappers.claude_client = anthropic.Anthropic(api_key=user_keys["claude"])
+        ai_wrappers.set_user_api_key("Claude", user_keys["claude"])
 
-    # For DeepSeek, we can store it in session_state so our ai_wrappers uses it.
     if user_keys["deepseek"]:
-        ai_wrappers.deepseek_client.set_api_key(user_keys["deepseek"])
+        ai_wrappers.set_user_api_key("DeepSeek", user_keys["deepseek"])
 
-    # For Gemini (Google), we can set the client directly.
     if user_keys["gemini"]:
-        ai_wrappers.genai_client = genai.Client(api_key=user_keys["gemini"])
+        ai_wrappers.set_user_api_key("Gemini", user_keys["gemini"])
+
+
+# Engine calls run on a background thread, where Streamlit can't render,
+# so debug messages are queued and written out from the script thread.
+debug_queue = queue.SimpleQueue()
 
 
 def debug_log(msg: str):
     """
-    Helper to write debug logs if debug_mode is on.
+    Helper to queue debug logs if debug_mode is on.
     :param msg: Message to log
     """
     if debug_mode:
-        st.sidebar.write(msg)
+        debug_queue.put(msg)
+
+
+def flush_debug_log():
+    """
+    Write all queued debug messages to the sidebar.
+    """
+    while not debug_queue.empty():
+        st.sidebar.write(debug_queue.get_nowait())
 
 
 # ========== Main UI Setup ==========
@@ -75,21 +85,147 @@ time_control = user_params["time_control"]
 minutes = user_params["minutes"]
 increment = user_params["increment"]
 random_fallback = user_params["random_fallback"]
+white_race = user_params["white_race"]
+black_race = user_params["black_race"]
+prefetch_replies = user_params["prefetch_replies"]
+parallel_attempts = user_params["parallel_attempts"]
+num_samples = user_params["num_samples"]
 start_button_clicked = user_params["start_button_clicked"]
 
-# Prepare a dictionary for speeds
-speed_dict = {"x1": 1, "x2": 2, "x3": 3, "x4": 4}
-
+board_title_placeholder = st.empty()
 board_placeholder = st.empty()
 move_placeholder = st.empty()
 status_placeholder = st.empty()
 
 # ======== Session State Setup ========
-if 'board_history' not in st.session_state:
-    st.session_state.board_history = []
+# Positions as (placement, last move); SVGs are rendered (and cached) only when shown
+if 'position_history' not in st.session_state:
+    st.session_state.position_history = []
 if 'move_log' not in st.session_state:
     st.session_state.move_log = []
 
+
+async def game_loop(board: chess.Board, engine_funcs: dict, sample_funcs: dict):
+    """
+    Play the game move by move until it ends, updating the board, move and clock displays.
+    Each move is awaited with the side's remaining clock as timeout, so a stalled engine
+    loses on time as soon as its clock runs out instead of after its request returns.
+    :param board: chess.Board to play on.
+    :param engine_funcs: dict of 'white'/'black' -> async engine function.
+    :param sample_funcs: dict of 'white'/'black' -> async sampling function, or None to not sample.
+    :return: the winner by forfeit ('white' or 'black'), or None if the game ended on the board.
+    """
+    engine_names = {'white': white_engine, 'black': black_engine}
+    # Opponent reply -> prefetched next move of the side that just moved
+    prefetches = {}
+
+    turn = 'white'
+    forfeit_winner = None
+    # When the next move may be shown. The pause between moves is only for watching the game,
+    # so it runs concurrently with the next engine request instead of before it.
+    show_at = 0.0
+
+    try:
+        while not board.is_game_over():
+            # Identify engine & sub-model
+            engine_func = engine_funcs[turn]
+            sub_model = white_sub_model if turn == 'white' else black_sub_model
+
+            start_time = time.time()
+
+            include_valid_moves = user_params["include_valid_moves"]
+            try:
+                move, san = await asyncio.wait_for(
+                    safe_get_move_async(
+                        board=board,
+                        engine_func=engine_func,
+                        sub_model=sub_model,
+                        turn=turn,
+                        max_retries=3,
+                        random_fallback=random_fallback,
+                        debug_log=debug_log,
+                        include_valid_moves=include_valid_moves,
+                        parallel_attempts=parallel_attempts,
+                        sample_func=sample_funcs[turn]
+                    ),
+                    timeout=st.session_state.move_clock[turn] if time_control else None
+                )
+                elapsed = time.time() - start_time
+            except asyncio.TimeoutError:
+                flush_debug_log()
+                st.session_state.move_clock[turn] = 0
+                st.warning(f"{turn.title()} ran out of time — forfeit.")
+                forfeit_winner = 'black' if turn == 'white' else 'white'
+                break
+            flush_debug_log()
+
+            # If no move => forfeit
+            if move is None:
+                forfeit_winner = 'black' if turn == 'white' else 'white'
+                break
+
+            # Push the move
+            board.push(move)
+
+            # The move that was played keeps its prefetch (the real request will join it); drop the rest
+            prefetches.pop(move, None)
+            for future in prefetches.values():
+                future.cancel()
+            # A sampling side never reads get_move's reply for its move, so its prefetches would be wasted calls
+            if sample_funcs[turn] is None:
+                prefetches = prefetch_moves(
+                    engine_names[turn], sub_model, board, likely_replies(board, prefetch_replies),
+                    debug_log=debug_log, include_valid_moves=include_valid_moves
+                )
+            else:
+                prefetches = {}
+
+            # Whatever is left of the pause after the previous move (not charged to either clock)
+            await asyncio.sleep(max(0.0, show_at - time.monotonic()))
+
+            # Update board
+            position = board_position(board)
+            st.session_state.position_history.append(position)
+            board_placeholder.markdown(position_svg(position), unsafe_allow_html=True)
+
+            # Time control
+            if time_control and st.session_state.move_clock[turn] is not None:
+                st.session_state.move_clock[turn] -= elapsed
+                # st.session_state.move_clock[turn] += increment  # If you want increment
+                if st.session_state.move_clock[turn] <= 0:
+                    st.warning(f"{turn.title()} ran out of time — forfeit.")
+                    forfeit_winner = 'black' if turn == 'white' else 'white'
+                    break
+
+            # Logging/PGN
+            st.session_state.node = st.session_state.node.add_variation(move)
+            # The board has the move pushed already; White's move hasn't advanced the move number yet
+            st.session_state.pgn_movetext.append(f"{board.fullmove_number}. {san}" if turn == 'white' else san)
+            st.session_state.move_log.append(f"{turn.title()} played: {san}")
+
+            # Clocks
+            if time_control:
+                clocks = (
+                    f"W={st.session_state.move_clock['white']:.1f}s | "
+                    f"B={st.session_state.move_clock['black']:.1f}s"
+                )
+            else:
+                clocks = "Timeless"
+
+            move_placeholder.markdown(f"**Move**: {san} ({turn}) — {clocks}")
+
+            # Speed factor
+            speed_factor = SPEED_FACTORS[speedup_choice]
+            show_at = time.monotonic() + 1.0 / speed_factor
+
+            turn = 'black' if turn == 'white' else 'white'
+    finally:
+        for future in prefetches.values():
+            future.cancel()
+
+    return forfeit_winner
+
+
 # ======== If Start Game is clicked ========
 if start_button_clicked:
     # Override API keys if provided
@@ -103,10 +239,11 @@ if start_button_clicked:
         'White': f"{white_engine}({white_sub_model})",
         'Black': f"{black_engine}({black_sub_model})"
     })
-    st.session_state.board_history.clear()
+    st.session_state.position_history.clear()
     st.session_state.board = board
     st.session_state.pgn = game
     st.session_state.node = game
+    st.session_state.pgn_movetext = []
     st.session_state.move_log.clear()
 
     # Setup clocks
@@ -116,82 +253,36 @@ if start_button_clicked:
     }
 
     # Display initial board
-    board_svg = chess.svg.board(board=board, size=400)
-    st.session_state.board_history.append(board_svg)
-    board_placeholder.markdown("### Current Position")
-    board_placeholder.markdown(board_svg, unsafe_allow_html=True)
-
-    turn = 'white'
-    forfeit_winner = None
-
-    while not board.is_game_over():
-        # Identify engine & sub-model
-        if turn == 'white':
-            engine_func = ENGINE_FUNCTIONS[white_engine]
-            sub_model = white_sub_model
-        else:
-            engine_func = ENGINE_FUNCTIONS[black_engine]
-            sub_model = black_sub_model
-
-        start_time = time.time()
-
-        include_valid_moves = user_params["include_valid_moves"]
-        move = safe_get_move(
-            board=board,
-            engine_func=engine_func,
-            sub_model=sub_model,
-            turn=turn,
-            max_retries=3,
-            random_fallback=random_fallback,
-            debug_log=debug_log,
-            include_valid_moves=include_valid_moves
-        )
-
-        # If no move => forfeit
-        if move is None:
-            forfeit_winner = 'black' if turn == 'white' else 'white'
-            break
-
-        # Push the move
-        san = board.san(move)
-        board.push(move)
-
-        # Update board
-        current_board_svg = chess.svg.board(board=board, size=400)
-        st.session_state.board_history.append(current_board_svg)
-        board_placeholder.markdown("### Current Position")
-        board_placeholder.markdown(current_board_svg, unsafe_allow_html=True)
-
-        # Time control
-        elapsed = time.time() - start_time
-        if time_control and st.session_state.move_clock[turn] is not None:
-            st.session_state.move_clock[turn] -= elapsed
-            # st.session_state.move_clock[turn] += increment  # If you want increment
-            if st.session_state.move_clock[turn] <= 0:
-                st.warning(f"{turn.title()} ran out of time — forfeit.")
-                forfeit_winner = 'black' if turn == 'white' else 'white'
-                break
-
-        # Logging/PGN
-        st.session_state.node = st.session_state.node.add_variation(move)
-        st.session_state.move_log.append(f"{turn.title()} played: {san}")
-
-        # Clocks
-        if time_control:
-            clocks = (
-                f"W={st.session_state.move_clock['white']:.1f}s | "
-                f"B={st.session_state.move_clock['black']:.1f}s"
-            )
-        else:
-            clocks = "Timeless"
-
-        move_placeholder.markdown(f"**Move**: {san} ({turn}) — {clocks}")
+    position = board_position(board)
+    st.session_state.position_history.append(position)
+    # The title is written once; each move only replaces the board element itself
+    board_title_placeholder.markdown("### Current Position")
+    board_placeholder.markdown(position_svg(position), unsafe_allow_html=True)
+
+    # Fast mode: a side with extra race engines gets a racing engine function
+    engine_funcs = {
+        'white': (race_engine_function([(white_engine, white_sub_model)] + white_race)
+                  if white_race else ENGINE_FUNCTIONS_ASYNC[white_engine]),
+        'black': (race_engine_function([(black_engine, black_sub_model)] + black_race)
+                  if black_race else ENGINE_FUNCTIONS_ASYNC[black_engine])
+    }
 
-        # Speed factor
-        speed_factor = speed_dict[speedup_choice]
-        time.sleep(1.0 / speed_factor)
+    # Several samples per request, for sides that don't race other engines
+    sample_funcs = {
+        'white': (functools.partial(ENGINE_SAMPLERS_ASYNC[white_engine], num_samples=num_samples)
+                  if num_samples > 1 and not white_race else None),
+        'black': (functools.partial(ENGINE_SAMPLERS_ASYNC[black_engine], num_samples=num_samples)
+                  if num_samples > 1 and not black_race else None)
+    }
 
-        turn = 'black' if turn == 'white' else 'white'
+    # One event loop drives the whole game; engine requests themselves run on the shared engine loop
+    try:
+        forfeit_winner = asyncio.run(game_loop(board, engine_funcs, sample_funcs))
+    except BaseException:
+        # Any widget change reruns the script and stops the game mid-way (Streamlit raises
+        # through the loop); log the moves played so far instead of losing the game.
+        logging.info(export_pgn(st.session_state.pgn, st.session_state.pgn_movetext))
+        raise
 
     # ======== Game Over ========
     if forfeit_winner is not None:
@@ -212,27 +303,33 @@ if start_button_clicked:
             final_msg = "Draw!"
         status_placeholder.markdown(f"### Game over: {final_msg} ({result})")
 
-    # Save PGN
-    exporter = chess.pgn.StringExporter(headers=True, variations=True, comments=False)
-    pgn_text = st.session_state.pgn.accept(exporter)
-    logging.info(pgn_text)
+    # Save PGN; the button first, logging only enqueues the record for the log writer
+    pgn_text = export_pgn(st.session_state.pgn, st.session_state.pgn_movetext,
+                          final_result if forfeit_winner is not None else result)
     st.download_button('Download PGN', data=pgn_text, file_name='game.pgn')
+    logging.info(pgn_text)
 
 # ======== Slider for Historical Positions ========
-if 'board_history' in st.session_state and st.session_state.board_history:
-    if len(st.session_state.board_history) > 1:
+if 'position_history' in st.session_state and st.session_state.position_history:
+    if len(st.session_state.position_history) > 1:
         move_number = st.slider(
             "View previous positions",
             0,
-            len(st.session_state.board_history) - 1,
-            len(st.session_state.board_history) - 1
+            len(st.session_state.position_history) - 1,
+            len(st.session_state.position_history) - 1
         )
     else:
         move_number = 0
         st.text("Initial position")
 
-    st.markdown(st.session_state.board_history[move_number], unsafe_allow_html=True)
+    st.markdown(position_svg(st.session_state.position_history[move_number]), unsafe_allow_html=True)
     if move_number < len(st.session_state.move_log):
         st.write(f"Position after: {st.session_state.move_log[move_number]}")
     else:
         st.write("No move info available for this position.")
+
+    # Session state outlives the game (and the browser tab), so let the user drop it
+    if st.button("Clear history"):
+        st.session_state.position_history.clear()
+        st.session_state.move_log.clear()
+        st.rerun()
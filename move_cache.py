@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import orjson
+
+from config import MOVE_CACHE_PATH, MOVE_CACHE_TTL_DAYS
+
+_TTL_SECONDS = MOVE_CACHE_TTL_DAYS * 24 * 60 * 60
+
+_conn = None
+# Every query runs on this one thread: sqlite3 calls block (a commit fsyncs), and they must
+# not stall the shared engine loop. One worker also keeps writes in order on one connection.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="move-cache")
+
+
+def _connection() -> Optional[sqlite3.Connection]:
+    """
+    Open the cache database on first use, creating it (and dropping expired replies).
+    Only the cache's worker thread touches it, so one connection is enough.
+    :return: the connection, or None if the disk cache is disabled or unavailable.
+    """
+    global _conn
+    if _conn is None and MOVE_CACHE_PATH:
+        try:
+            os.makedirs(os.path.dirname(MOVE_CACHE_PATH) or ".", exist_ok=True)
+            conn = sqlite3.connect(MOVE_CACHE_PATH, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS moves (key TEXT PRIMARY KEY, reply TEXT, created REAL)")
+            conn.execute("DELETE FROM moves WHERE created < ?", (time.time() - _TTL_SECONDS,))
+            conn.commit()
+            _conn = conn
+        except sqlite3.Error:
+            return None
+    return _conn
+
+
+async def get(key: tuple) -> Optional[str]:
+    """
+    Look up a reply on the cache's worker thread.
+    :param key: move cache key (see ai_wrappers.get_move).
+    :return: the stored raw reply, or None if it is missing, expired or the cache is unavailable.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor, _get, key)
+
+
+def put(key: tuple, reply: str):
+    """
+    Queue a reply to be stored by the cache's worker thread; returns without waiting for the write.
+    :param key: move cache key (see ai_wrappers.get_move).
+    :param reply: raw engine reply.
+    """
+    _executor.submit(_put, key, reply)
+
+
+def _get(key: tuple) -> Optional[str]:
+    """
+    Blocking body of get.
+    """
+    conn = _connection()
+    if conn is None:
+        return None
+    try:
+        row = conn.execute("SELECT reply FROM moves WHERE key = ? AND created >= ?",
+                           (orjson.dumps(key).decode(), time.time() - _TTL_SECONDS)).fetchone()
+    except sqlite3.Error:
+        return None
+    return row[0] if row else None
+
+
+def _put(key: tuple, reply: str):
+    """
+    Blocking body of put. Failures are ignored: the disk cache is only an optimization.
+    """
+    conn = _connection()
+    if conn is None:
+        return
+    try:
+        conn.execute("INSERT OR REPLACE INTO moves VALUES (?, ?, ?)",
+                     (orjson.dumps(key).decode(), reply, time.time()))
+        conn.commit()
+    except sqlite3.Error:
+        pass
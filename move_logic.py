@@ -1,10 +1,141 @@
+import asyncio
 import random
 import chess
 import streamlit as st
-from typing import Callable, Optional
+import async_runner
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 
+FEN_CACHE_SIZE = 10_000
 
-def safe_get_move(
+# (transposition key, halfmove clock, fullmove number) -> FEN
+_fen_cache = {}
+
+
+def board_fen(board: chess.Board) -> str:
+    """
+    board.fen(), memoized per position. fen() walks all 64 squares on every call, while the
+    transposition key is a handful of bitboards; with several engines (and the cache lookup)
+    asking about the same ply, the string is built once.
+    :param board: The current chess.Board object.
+    :return: The FEN string.
+    """
+    key = (board._transposition_key(), board.halfmove_clock, board.fullmove_number)
+    fen = _fen_cache.get(key)
+    if fen is None:
+        if len(_fen_cache) >= FEN_CACHE_SIZE:
+            _fen_cache.clear()
+        fen = _fen_cache[key] = board.fen()
+    return fen
+
+
+@dataclass(frozen=True, slots=True)
+class BoardSnapshot:
+    """
+    Immutable, hashable view of a position: everything the engine functions read from a board.
+    Built once per ply and shared by every engine consulting that position, so the FEN and
+    legal-move work happens exactly once, and later board mutations can't leak into a request.
+    """
+    fen: str
+    turn: chess.Color
+    legal_uci: Tuple[str, ...]
+
+    @classmethod
+    def from_board(cls, board: chess.Board) -> "BoardSnapshot":
+        """
+        :param board: chess.Board object representing the current game state.
+        :return: snapshot of its current position.
+        """
+        return cls(board_fen(board), board.turn, tuple(move.uci() for move in board.generate_legal_moves()))
+
+    def to_board(self) -> chess.Board:
+        """
+        :return: a new chess.Board set up at this position (without move history).
+        """
+        return chess.Board(self.fen)
+
+
+def parse_move(board: chess.Board, raw_move: str) -> Optional[chess.Move]:
+    """
+    Parse an engine reply as UCI, falling back to SAN.
+    :param board: chess.Board object representing the current game state.
+    :param raw_move: raw move string returned by the engine.
+    :return: the legal chess.Move, or None if the reply is not a legal move.
+    """
+    try:
+        move = board.parse_uci(raw_move)
+    except ValueError:
+        # If not UCI, try SAN
+        try:
+            move = board.parse_san(raw_move)
+        except ValueError:
+            move = None
+
+    if move is not None and move in board.legal_moves:
+        return move
+    return None
+
+
+class LegalMoves:
+    """
+    Legal moves of one position indexed by UCI and SAN, built once per turn so that
+    validating each engine reply is a dict lookup instead of a fresh parse (which
+    generates the legal moves again). The SAN index is only built if a reply isn't UCI.
+    """
+    __slots__ = ("board", "by_uci", "_by_san")
+
+    def __init__(self, board: chess.Board):
+        self.board = board
+        self.by_uci = {move.uci(): move for move in board.generate_legal_moves()}
+        self._by_san = None
+
+    @property
+    def by_san(self) -> Dict[str, chess.Move]:
+        """
+        SAN without check/annotation suffixes -> move.
+        """
+        if self._by_san is None:
+            self._by_san = {self.board.san(move).rstrip("+#"): move for move in self.by_uci.values()}
+        return self._by_san
+
+    def match(self, raw_move: str) -> Optional[Tuple[chess.Move, str]]:
+        """
+        :param raw_move: raw move string returned by the engine.
+        :return: (move, SAN) if the reply is a legal move, else None.
+        """
+        move = self.by_uci.get(raw_move) or self.by_san.get(raw_move.rstrip("+#!?"))
+        if move is None:
+            # Rarer spellings parse_san also accepts (e.g. "O-O" written with zeros)
+            move = parse_move(self.board, raw_move)
+        return (move, self.board.san(move)) if move is not None else None
+
+
+def likely_replies(board: chess.Board, count: int) -> List[chess.Move]:
+    """
+    Cheap guess at the opponent's most likely replies, used for speculative prefetching:
+    captures (most valuable victim first), then checks, then the remaining moves.
+    :param board: chess.Board object with the opponent to move.
+    :param count: maximum number of replies to return.
+    :return: up to count legal moves.
+    """
+    if count <= 0:
+        return []
+
+    def score(move: chess.Move) -> int:
+        if board.is_capture(move):
+            victim = board.piece_type_at(move.to_square) or chess.PAWN  # None for en passant
+            return 10 + victim
+        return 1 if board.gives_check(move) else 0
+
+    return sorted(board.legal_moves, key=score, reverse=True)[:count]
+
+
+# Temperatures of the parallel attempts at one position: the first is the deterministic
+# request, the others only differ enough to give a second opinion.
+ATTEMPT_TEMPERATURES = (0.0, 0.7, 1.0)
+
+
+async def safe_get_move_async(
         board: chess.Board,
         engine_func: Callable,
         sub_model: str,
@@ -12,49 +143,74 @@ def safe_get_move(
         max_retries=3,
         random_fallback=True,
         debug_log=lambda m: None,
-        include_valid_moves=False
-) -> Optional[chess.Move]:
+        include_valid_moves=False,
+        parallel_attempts=1,
+        sample_func: Optional[Callable] = None
+) -> Tuple[Optional[chess.Move], Optional[str]]:
     """
     Attempt to get a valid/legal move from the engine_func up to max_retries times.
     If random_fallback is True, fallback to random legal move after repeated failures.
     If false, return None => forfeit.
+    Engine requests run on the shared engine loop, so the awaiting game loop stays free
+    to enforce the move clock (asyncio.wait_for) while a model is thinking.
+    With parallel_attempts > 1, each try sends that many requests at once (one per
+    ATTEMPT_TEMPERATURES entry) and plays the first legal reply, cancelling the rest.
+    With a sample_func, each try is instead one call returning several candidate moves,
+    and the API is only called again if none of them is legal.
     :param board: chess.Board object representing the current game state.
-    :param engine_func: function to call for move generation.
+    :param engine_func: async engine function to call for move generation.
     :param sub_model: sub-model to use for the engine.
     :param turn: current turn ('white' or 'black').
     :param max_retries: maximum number of attempts to get a valid move.
     :param random_fallback: whether to fallback to a random legal move if all attempts fail.
     :param debug_log: function to log debug messages.
     :param include_valid_moves: whether to include a list of valid moves in the prompt.
-    :return: a valid chess.Move object or None if no valid move is found.
+    :param parallel_attempts: number of concurrent requests per attempt (1 to len(ATTEMPT_TEMPERATURES)).
+    :param sample_func: optional async sampling function (see ai_wrappers.ENGINE_SAMPLERS_ASYNC)
+                        returning a list of raw moves; takes precedence over parallel_attempts.
+    :return: (chess.Move, SAN) of a valid move, or (None, None) if no valid move is found.
     """
     excluded_moves = []
+    snapshot = BoardSnapshot.from_board(board)
+    legal_moves = LegalMoves(board)
+    temperatures = ATTEMPT_TEMPERATURES[:1 if sample_func else max(1, parallel_attempts)]
+
+    async def replies(temperature: float) -> List[str]:
+        kwargs = dict(excluded_moves=list(excluded_moves), debug_log=debug_log, include_valid_moves=include_valid_moves)
+        if sample_func is not None:
+            return await async_runner.run_async(sample_func(snapshot, sub_model, **kwargs))
+        return [await async_runner.run_async(engine_func(snapshot, sub_model, temperature=temperature, **kwargs))]
 
     for attempt in range(max_retries):
-        raw_move = engine_func(board,
-                               sub_model,
-                               excluded_moves=excluded_moves,
-                               debug_log=debug_log,
-                               include_valid_moves=include_valid_moves
-                               ).strip()
-        debug_log(f"{turn.title()} raw attempt #{attempt + 1} [model={sub_model}]: {raw_move}")
-
-        # Try parse UCI
+        tasks = [asyncio.create_task(replies(temperature)) for temperature in temperatures]
+        errors = []
         try:
-            move = board.parse_uci(raw_move)
-        except ValueError:
-            # If not UCI, try SAN
-            try:
-                move = board.parse_san(raw_move)
-            except ValueError:
-                move = None
+            for next_replies in asyncio.as_completed(tasks):
+                try:
+                    raw_moves = await next_replies
+                except Exception as exc:
+                    # One failed request shouldn't sink the attempt while others are still running
+                    errors.append(exc)
+                    debug_log(f"{turn.title()} attempt #{attempt + 1} [model={sub_model}] failed: {exc!r}")
+                    continue
+
+                for raw_move in raw_moves:
+                    raw_move = raw_move.strip()
+                    debug_log(f"{turn.title()} raw attempt #{attempt + 1} [model={sub_model}]: {raw_move}")
+
+                    played = legal_moves.match(raw_move)
+                    if played is not None:
+                        return played
 
-        if move is not None and move in board.legal_moves:
-            return move
+                    # Exclude invalid so model won't repeat
+                    if raw_move not in excluded_moves:
+                        excluded_moves.append(raw_move)
+                        debug_log(f"Excluded move appended: {raw_move}")
+        finally:
+            async_runner.cancel_all(tasks)
 
-        # Exclude invalid so model won't repeat
-        excluded_moves.append(raw_move)
-        debug_log(f"Excluded move appended: {raw_move}")
+        if len(errors) == len(tasks):
+            raise errors[0]
 
     # After max_retries
     if random_fallback:
@@ -62,10 +218,11 @@ def safe_get_move(
             f"{turn.title()} gave invalid moves after {max_retries} tries. "
             "Using random legal move as fallback."
         )
-        return random.choice(list(board.legal_moves))
+        move = random.choice(list(legal_moves.by_uci.values()))
+        return move, board.san(move)
     else:
         st.warning(
             f"{turn.title()} gave invalid moves after {max_retries} tries. "
             "No fallback — forfeit."
         )
-        return None
+        return None, None
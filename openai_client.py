@@ -1,46 +1,34 @@
-import contextlib
-import openai
+import importlib
 
 
 class OpenAIClient:
-    def __init__(self, api_key, api_base=None):
+    def __init__(self, api_key, api_base=None, http_client=None, max_retries=2):
         self.api_key = api_key
         self.api_base = api_base
+        self.http_client = http_client
+        self.max_retries = max_retries
+        self._client = self._build_client()
 
-    def set_api_key(self, new_api_key):
+    def _build_client(self):
         """
-        Update the API key for this client.
-        :param new_api_key: The new API key to set.
-        :return: None
+        Create the underlying async SDK client for this key and base URL.
+        :return: openai.AsyncOpenAI instance.
         """
-        self.api_key = new_api_key
+        openai = importlib.import_module("openai")
+        return openai.AsyncOpenAI(api_key=self.api_key, base_url=self.api_base, http_client=self.http_client,
+                                  max_retries=self.max_retries)
 
-    @contextlib.contextmanager
-    def use_config(self):
+    @property
+    def client(self):
         """
-        Context manager to temporarily set OpenAI API key and base URL.
-        We use this to make a client for OpenAI API calls and for DeepSeek.
+        The underlying openai.AsyncOpenAI client, for APIs not wrapped here (files, batches).
         """
-        # Save current configuration
-        old_api_key = openai.api_key
-        old_api_base = getattr(openai, "api_base", None)
-        # Set new configuration
-        openai.api_key = self.api_key
-        if self.api_base:
-            openai.api_base = self.api_base
-        try:
-            yield
-        finally:
-            # Restore previous configuration
-            openai.api_key = old_api_key
-            if old_api_base is not None:
-                openai.api_base = old_api_base
+        return self._client
 
-    def chat_completion(self, **kwargs):
+    async def chat_completion(self, **kwargs):
         """
-        Wrapper for OpenAI's ChatCompletion API.
+        Wrapper for OpenAI's async Chat Completions API.
         :param kwargs: Additional parameters for the API call.
         :return: API response.
         """
-        with self.use_config():
-            return openai.ChatCompletion.create(**kwargs)
+        return await self._client.chat.completions.create(**kwargs)
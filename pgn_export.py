@@ -0,0 +1,17 @@
+import textwrap
+
+import chess.pgn
+
+
+def export_pgn(game: chess.pgn.Game, movetext: list, result: str = "*") -> str:
+    """
+    Assemble the PGN from the movetext collected while playing, so the game tree isn't
+    walked again (and every SAN recomputed) at game end.
+    :param game: chess.pgn.Game holding the headers.
+    :param movetext: move tokens in order, e.g. ["1. e4", "e5", "2. Nf3"].
+    :param result: game termination marker ('1-0', '0-1', '1/2-1/2' or '*').
+    :return: PGN text, formatted like chess.pgn.StringExporter's.
+    """
+    game.headers["Result"] = result
+    tags = "".join(f'[{name} "{value}"]\n' for name, value in game.headers.items())
+    return tags + "\n" + textwrap.fill(" ".join(movetext + [result]), width=79, break_long_words=False)
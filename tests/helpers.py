@@ -0,0 +1,22 @@
+import random
+
+import chess
+
+
+def random_games(count: int, max_plies: int, seed: int = 0):
+    """
+    Yield boards of random playouts, one per ply, for equivalence checks against python-chess.
+    :param count: number of games.
+    :param max_plies: maximum number of plies per game.
+    :param seed: random seed, so failures are reproducible.
+    :return: generator of (game index, chess.Board after each ply).
+    """
+    rng = random.Random(seed)
+    for game_index in range(count):
+        board = chess.Board()
+        for _ in range(max_plies):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(rng.choice(moves))
+            yield game_index, board
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import chess
+
+import ai_wrappers
+import async_runner
+import move_cache
+from move_logic import BoardSnapshot
+
+
+class EngineFunctionsTest(unittest.TestCase):
+    def test_one_entry_per_engine(self):
+        self.assertEqual(set(ai_wrappers.ENGINE_FUNCTIONS), {"OpenAI", "Claude", "DeepSeek", "Gemini"})
+        self.assertEqual(set(ai_wrappers.ENGINE_FUNCTIONS_ASYNC), set(ai_wrappers.ENGINE_FUNCTIONS))
+
+
+class GetMoveTest(unittest.TestCase):
+    """
+    get_move against a fake provider, on the shared engine loop like the app.
+    """
+
+    def setUp(self):
+        self.calls = []
+        self.cancelled = []
+        self.reply = "e2e4"
+        self.release = None
+        ai_wrappers._move_cache.clear()
+        patches = [
+            mock.patch.dict(ai_wrappers.PROVIDERS, {"OpenAI": self.fake_call}),
+            mock.patch.object(ai_wrappers, "get_client", lambda engine: None),
+            mock.patch.object(move_cache, "MOVE_CACHE_PATH", None)
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(ai_wrappers._move_cache.clear)
+
+    async def fake_call(self, client, model, prompt, temperature=0.0):
+        self.calls.append(prompt)
+        try:
+            if self.release is not None:
+                await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(prompt)
+            raise
+        return self.reply
+
+    def snapshot(self) -> BoardSnapshot:
+        return BoardSnapshot.from_board(chess.Board())
+
+    def test_concurrent_identical_requests_share_one_call(self):
+        async def scenario():
+            self.release = asyncio.Event()
+            first = asyncio.ensure_future(ai_wrappers.get_move("OpenAI", self.snapshot(), "m"))
+            second = asyncio.ensure_future(ai_wrappers.get_move("OpenAI", self.snapshot(), "m"))
+            await asyncio.sleep(0)
+            self.release.set()
+            return await asyncio.gather(first, second)
+
+        self.assertEqual(async_runner.run(scenario()), ["e2e4", "e2e4"])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_request_is_cancelled_only_with_its_last_waiter(self):
+        async def scenario():
+            self.release = asyncio.Event()
+            first = asyncio.ensure_future(ai_wrappers.get_move("OpenAI", self.snapshot(), "m"))
+            second = asyncio.ensure_future(ai_wrappers.get_move("OpenAI", self.snapshot(), "m"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            await asyncio.sleep(0.01)
+            still_running = not self.cancelled
+            second.cancel()
+            await asyncio.sleep(0.01)
+            return still_running
+
+        self.assertTrue(async_runner.run(scenario()))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(self.cancelled), 1)
+        self.assertEqual(ai_wrappers._inflight, {})
+
+    def test_legal_reply_is_cached(self):
+        for _ in range(2):
+            self.assertEqual(async_runner.run(ai_wrappers.get_move("OpenAI", self.snapshot(), "m")), "e2e4")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_illegal_reply_is_asked_again(self):
+        self.reply = "Nf6"
+        for _ in range(2):
+            self.assertEqual(async_runner.run(ai_wrappers.get_move("OpenAI", self.snapshot(), "m")), "Nf6")
+        self.assertEqual(len(self.calls), 2)
+
+    def test_forced_move_skips_the_api(self):
+        board = chess.Board("8/8/8/8/8/8/5k2/7K w - - 0 1")
+        snapshot = BoardSnapshot.from_board(board)
+        self.assertEqual(async_runner.run(ai_wrappers.get_move("OpenAI", snapshot, "m")), "h1h2")
+        self.assertEqual(self.calls, [])
+
+
+class FirstTokenTest(unittest.TestCase):
+    def test_first_token(self):
+        self.assertEqual(ai_wrappers.first_token("  e2e4 because it is best"), "e2e4")
+        self.assertEqual(ai_wrappers.first_token("e7e8q\n"), "e7e8q")
+        self.assertEqual(ai_wrappers.first_token(" \n"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import move_cache
+
+KEY = (2, "OpenAI", "gpt-4o-mini", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", (), False, 0.0)
+
+
+class MoveCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patch = mock.patch.object(move_cache, "MOVE_CACHE_PATH", os.path.join(directory.name, "moves.sqlite3"))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(self.close)
+
+    def close(self):
+        # The connection lives on the cache's worker thread
+        if move_cache._conn is not None:
+            move_cache._executor.submit(move_cache._conn.close).result()
+            move_cache._conn = None
+
+    def test_put_then_get(self):
+        move_cache.put(KEY, "e2e4")
+        self.assertEqual(asyncio.run(move_cache.get(KEY)), "e2e4")
+        self.assertIsNone(asyncio.run(move_cache.get(KEY[:-1] + (0.7,))))
+
+    def test_expired_reply_is_not_served(self):
+        move_cache.put(KEY, "e2e4")
+        with mock.patch.object(move_cache, "_TTL_SECONDS", -1):
+            self.assertIsNone(asyncio.run(move_cache.get(KEY)))
+        self.assertEqual(asyncio.run(move_cache.get(KEY)), "e2e4")
+
+    def test_disabled(self):
+        with mock.patch.object(move_cache, "MOVE_CACHE_PATH", None):
+            move_cache.put(KEY, "e2e4")
+            self.assertIsNone(asyncio.run(move_cache.get(KEY)))
+
+
+if __name__ == "__main__":
+    unittest.main()
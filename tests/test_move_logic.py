@@ -0,0 +1,42 @@
+import unittest
+
+import chess
+
+from move_logic import BoardSnapshot, LegalMoves, board_fen, parse_move
+from tests.helpers import random_games
+
+
+class BoardFenTest(unittest.TestCase):
+    def test_matches_fen_on_random_playouts(self):
+        for _, board in random_games(20, 80):
+            self.assertEqual(board_fen(board), board.fen())
+
+
+class BoardSnapshotTest(unittest.TestCase):
+    def test_round_trip(self):
+        board = chess.Board()
+        board.push_san("e4")
+        snapshot = BoardSnapshot.from_board(board)
+        self.assertEqual(snapshot.to_board().fen(), board.fen())
+        self.assertEqual(set(snapshot.legal_uci), {move.uci() for move in board.legal_moves})
+        self.assertEqual(hash(snapshot), hash(BoardSnapshot.from_board(board)))
+
+
+class LegalMovesTest(unittest.TestCase):
+    def test_matches_parse_move_on_random_playouts(self):
+        for _, board in random_games(3, 30, seed=1):
+            legal_moves = LegalMoves(board)
+            for move in board.legal_moves:
+                san = board.san(move)
+                for raw_move in (move.uci(), san, san.rstrip("+#")):
+                    self.assertEqual(legal_moves.match(raw_move), (move, san))
+                    self.assertEqual(parse_move(board, raw_move), move)
+
+    def test_rejects_illegal_and_malformed_replies(self):
+        legal_moves = LegalMoves(chess.Board())
+        for raw_move in ("Nf6", "e2e5", "", "hello", "e7e5"):
+            self.assertIsNone(legal_moves.match(raw_move))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import chess
+import chess.pgn
+
+from pgn_export import export_pgn
+from tests.helpers import random_games
+
+
+class ExportPgnTest(unittest.TestCase):
+    def test_matches_string_exporter_on_random_games(self):
+        # Every game is played on its own board, so the last one yielded per game is its final position
+        games = {}
+        for game_index, board in random_games(15, 150, seed=2):
+            games[game_index] = board
+
+        for board in games.values():
+            game = chess.pgn.Game.from_board(board)
+            game.headers["Event"] = "AI Chess Battle Royale"
+            expected = game.accept(chess.pgn.StringExporter(headers=True, variations=False, comments=False))
+
+            movetext = []
+            replay = chess.Board()
+            for move in board.move_stack:
+                san = replay.san(move)
+                replay.push(move)
+                movetext.append(f"{replay.fullmove_number}. {san}" if replay.turn == chess.BLACK else san)
+            self.assertEqual(export_pgn(game, movetext, board.result(claim_draw=False)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
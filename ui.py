@@ -1,32 +1,69 @@
+import re
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import chess
+import chess.svg
 import streamlit as st
 
-# More models can be added here
-ENGINE_MODELS = {
-    "OpenAI": [
-        "gpt-4o-mini",
-        "gpt-3.5-turbo",
-        "gpt-4o",
-        # "o3-mini", # Currently not available for my tier at the openai API
-        # "o1-mini" # Currently not available for my tier at the openai API
-    ],
-    "Claude": [
-        "claude-3-5-haiku-latest",
-        "claude-3-haiku-latest",
-        "claude-3-7-sonnet-latest",
-        "claude-3-5-sonnet-latest",
-        "claude-3-opus-latest",
-        "claude-2.1"
-    ],
-    "DeepSeek": [
-        "deepseek-chat",
-        "deepseek-reasoner"
-    ],
-    "Gemini": [
-        "gemini-2.0-flash",
-        "gemini-pro",
-        "gemini-2.0-flash-lite"
-    ]
-}
+from engine_models import ENGINE_MODELS, ENGINE_KEYS, ENGINE_CHOICES
+
+# Move speed choice -> moves shown per second
+SPEED_FACTORS = {"x1": 1, "x2": 2, "x3": 3, "x4": 4}
+
+_CREDITS_MARKDOWN = (
+    "---\n"
+    "### Credits\n"
+    "Developed by: **Guy Perry**\n\n"
+    "[![GitHub icon](https://img.icons8.com/ios-glyphs/30/000000/github.png)]"
+    "(https://github.com/guyigoog) "
+    "[![LinkedIn icon](https://img.icons8.com/ios-glyphs/30/000000/linkedin.png)]"
+    "(https://www.linkedin.com/in/guy-perry/)"
+)
+
+BOARD_SVG_SIZE = 400
+SVG_CACHE_SIZE = 512
+
+# The ASCII copy of the board in <desc> is only for screen readers of standalone files
+_SVG_DESC = re.compile(r"<desc>.*?</desc>", re.DOTALL)
+_SVG_GAPS = re.compile(r">\s+<")
+
+
+def board_position(board: chess.Board) -> Tuple[str, Optional[str]]:
+    """
+    The little that's needed to draw a board: piece placement and last move.
+    This is what the position history keeps, a few dozen bytes instead of a whole SVG.
+    :param board: chess.Board to describe.
+    :return: (piece placement part of the FEN, last move in UCI or None).
+    """
+    return board.board_fen(), board.peek().uci() if board.move_stack else None
+
+
+def position_svg(position: Tuple[str, Optional[str]], size: int = BOARD_SVG_SIZE) -> str:
+    """
+    SVG of a position from board_position(), rendered once per (placement, size, last move)
+    and reused for repeated positions and history scrubbing.
+    :param position: (piece placement, last move in UCI or None).
+    :param size: width/height in pixels.
+    :return: minified SVG markup.
+    """
+    return _render_board_svg(position[0], size, position[1])
+
+
+@lru_cache(maxsize=SVG_CACHE_SIZE)
+def _render_board_svg(board_fen: str, size: int, lastmove: Optional[str]) -> str:
+    """
+    Memoized body of position_svg, keyed on hashable arguments only.
+    :param board_fen: piece placement part of the FEN.
+    :param size: width/height in pixels.
+    :param lastmove: last move in UCI, or None.
+    :return: minified SVG markup.
+    """
+    # No coordinates: their glyph paths are nearly half of the markup
+    svg = chess.svg.board(chess.BaseBoard(board_fen), size=size, coordinates=False,
+                          lastmove=chess.Move.from_uci(lastmove) if lastmove else None)
+    # Fewer bytes for Streamlit to send over the websocket on every redraw
+    return _SVG_GAPS.sub("><", _SVG_DESC.sub("", svg)).replace(" />", "/>")
 
 
 def render_sidebar():
@@ -36,30 +73,21 @@ def render_sidebar():
         debug_mode (bool), speedup_choice (str)
     """
     debug_mode = st.sidebar.checkbox("Enable Debug Mode?")
-    speed_options = ["x1", "x2", "x3", "x4"]
-    speedup_choice = st.sidebar.selectbox("Move Speed", speed_options, index=0)
+    speedup_choice = st.sidebar.selectbox("Move Speed", tuple(SPEED_FACTORS), index=0)
 
     with st.sidebar.expander("AI Response Log"):
         if 'move_log' in st.session_state:
             st.text_area("Move Log", value="\n".join(st.session_state.move_log), height=400)
         else:
             st.text_area("Move Log", value="", height=400)
-    st.sidebar.markdown("---")
-    st.sidebar.markdown("### Credits")
-    st.sidebar.markdown("Developed by: **Guy Perry**")
-
-    st.sidebar.markdown(
-        "[![GitHub icon](https://img.icons8.com/ios-glyphs/30/000000/github.png)]"
-        "(https://github.com/guyigoog) "
-        "[![LinkedIn icon](https://img.icons8.com/ios-glyphs/30/000000/linkedin.png)]"
-        "(https://www.linkedin.com/in/guy-perry/)"
-    )
+    st.sidebar.markdown(_CREDITS_MARKDOWN)
     return debug_mode, speedup_choice
 
 
 def render_main_ui():
     """
-    Renders the main UI area (title, engine selects, time controls, fallback toggle, include valid moves toggle).
+    Renders the main UI area (title, engine selects, time controls, fallback toggle, include valid moves toggle,
+    fast mode options).
     Returns all selected user parameters in a dictionary.
     :return: dict of main UI parameters based on user input
     """
@@ -68,7 +96,7 @@ def render_main_ui():
     col1, col2 = st.columns(2)
     with col1:
         # White choices
-        white_engine = st.selectbox('White Engine', list(ENGINE_MODELS.keys()), key="white_engine")
+        white_engine = st.selectbox('White Engine', ENGINE_KEYS, key="white_engine")
         white_sub_model = st.selectbox(
             "White Sub-Model",
             ENGINE_MODELS[white_engine],
@@ -76,7 +104,7 @@ def render_main_ui():
         )
     with col2:
         # Black choices
-        black_engine = st.selectbox('Black Engine', list(ENGINE_MODELS.keys()), key="black_engine")
+        black_engine = st.selectbox('Black Engine', ENGINE_KEYS, key="black_engine")
         black_sub_model = st.selectbox(
             "Black Sub-Model",
             ENGINE_MODELS[black_engine],
@@ -107,6 +135,51 @@ def render_main_ui():
              "It can potentially decrease API calls but will increase token usage."
     )
 
+    # Fast mode: options that trade extra API calls for lower move latency
+    with st.expander("Fast mode (lower latency, extra API calls)"):
+        st.caption(
+            "Race: each ply is sent to the side's engine and the engines picked here at the same time; "
+            "the first legal reply is played and the other requests are cancelled."
+        )
+        white_race = st.multiselect(
+            "Race White against",
+            ENGINE_CHOICES,
+            format_func=lambda choice: f"{choice[0]}/{choice[1]}",
+            key="white_race"
+        )
+        black_race = st.multiselect(
+            "Race Black against",
+            ENGINE_CHOICES,
+            format_func=lambda choice: f"{choice[0]}/{choice[1]}",
+            key="black_race"
+        )
+        prefetch_replies = st.number_input(
+            "Prefetch replies",
+            min_value=0,
+            max_value=5,
+            value=0,
+            help="While the opponent is thinking, already ask the side that just moved for its next move "
+                 "after this many likely opponent replies. 0 turns prefetching off. Not used by sides that "
+                 "take several samples per request."
+        )
+        parallel_attempts = st.number_input(
+            "Parallel attempts per move",
+            min_value=1,
+            max_value=3,
+            value=1,
+            help="Send this many requests per attempt at once, each with a different temperature, and play "
+                 "the first legal reply. 1 keeps the usual one-request-at-a-time retries."
+        )
+        num_samples = st.number_input(
+            "Samples per request",
+            min_value=1,
+            max_value=5,
+            value=1,
+            help="Ask for this many candidate moves in one round-trip (a single n= request on OpenAI, "
+                 "concurrent requests elsewhere) and play the first legal one. Replaces parallel attempts and "
+                 "turns off prefetching; not used by sides that race other engines."
+        )
+
     start_button_clicked = st.button('Start Game')
 
     return {
@@ -119,6 +192,11 @@ def render_main_ui():
         "increment": increment,
         "random_fallback": random_fallback,
         "include_valid_moves": include_valid_moves,
+        "white_race": white_race,
+        "black_race": black_race,
+        "prefetch_replies": prefetch_replies,
+        "parallel_attempts": parallel_attempts,
+        "num_samples": num_samples,
         "start_button_clicked": start_button_clicked
     }
 